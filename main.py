@@ -1,10 +1,31 @@
+import asyncio
 import json
+import sqlite3
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager, contextmanager
+from enum import IntEnum
+from functools import wraps
 from pathlib import Path
-from typing import Dict, Iterable, List
+from typing import (
+    AbstractSet,
+    Callable,
+    DefaultDict,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NotRequired,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    TypedDict,
+)
 
 from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import RedirectResponse
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse, RedirectResponse
+from pydantic import BaseModel, Field, field_validator
 
 STATUS_REGISTRADO = "REGISTRADO"
 STATUS_PAGADO = "PAGADO"
@@ -13,17 +34,117 @@ STATUS_CANCELADO = "CANCELADO"
 
 PAYMENT_METHOD_CREDIT_CARD = "credit_card"
 PAYMENT_METHOD_PAYPAL = "paypal"
-SUPPORTED_PAYMENT_METHODS = {
-    PAYMENT_METHOD_CREDIT_CARD,
-    PAYMENT_METHOD_PAYPAL,
-}
 
-DATA_PATH = Path("data.json")
+
+# Internamente (memoria y base) estados y métodos son enteros; los strings de
+# arriba se usan solo en el borde de la API.
+class Status(IntEnum):
+    REGISTRADO = 0
+    PAGADO = 1
+    FALLIDO = 2
+    CANCELADO = 3
+
+
+class PaymentMethod(IntEnum):
+    CREDIT_CARD = 0
+    PAYPAL = 1
+
+
+class PaymentDict(TypedDict):
+    """Representación interna de un pago (caché y operaciones)."""
+
+    amount: float
+    payment_method: int
+    status: int
+    version: NotRequired[int]
+
+
+_STATUS_TO_STR = (STATUS_REGISTRADO, STATUS_PAGADO, STATUS_FALLIDO, STATUS_CANCELADO)
+_METHOD_TO_STR = (PAYMENT_METHOD_CREDIT_CARD, PAYMENT_METHOD_PAYPAL)
+_METHOD_FROM_STR = {name: PaymentMethod(code) for code, name in enumerate(_METHOD_TO_STR)}
+SUPPORTED_PAYMENT_METHODS = frozenset(_METHOD_FROM_STR)
+
+DB_PATH = Path("data.db")
+# Almacén anterior a SQLite: si existe y la tabla está vacía, se importa una vez.
+LEGACY_DATA_PATH = Path("data.json")
+MAX_WRITE_ATTEMPTS = 3
+# Caché de páginas de SQLite (en KiB). El default (~2 MiB) obliga a releer las
+# páginas del B-tree con read() en cada UPDATE cuando la tabla crece.
+SQLITE_CACHE_KIB = 16 * 1024
+# El WAL es el log de escrituras append-only: cada COMMIT agrega solo las páginas
+# modificadas. Al llegar a WAL_CHECKPOINT_PAGES (el default de SQLite, ~4 MiB)
+# se hace checkpoint sobre el archivo principal, y cuando el WAL vuelve a
+# empezar se trunca a WAL_SIZE_LIMIT_BYTES para que el archivo no quede en su
+# tamaño máximo.
+WAL_CHECKPOINT_PAGES = 1000
+WAL_SIZE_LIMIT_BYTES = 1024 * 1024
+# Hasta este tamaño SQLite lee el archivo mapeado en memoria (sin una llamada
+# read() por página); las lecturas comparten el page cache del sistema.
+MMAP_SIZE_BYTES = 64 * 1024 * 1024
+
+# `version` permite concurrencia optimista (UPDATE ... WHERE version = ?) y el
+# índice parcial único hace que la base rechace un segundo pago con tarjeta en
+# REGISTRADO aunque la vista en memoria esté desactualizada.
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS payments (
+    payment_id TEXT PRIMARY KEY,
+    amount REAL NOT NULL,
+    payment_method INTEGER NOT NULL,
+    status INTEGER NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE UNIQUE INDEX IF NOT EXISTS cc_one_pending
+    ON payments (payment_method)
+    WHERE payment_method = {PaymentMethod.CREDIT_CARD:d} AND status = {Status.REGISTRADO:d};
+"""
+
+# Las sentencias se definen una sola vez: sqlite3 guarda en cada conexión las
+# sentencias ya compiladas indexadas por su texto, así que reutilizar el mismo
+# string evita volver a parsear y planificar el SQL en cada request.
+SQL_SELECT_ALL = "SELECT payment_id, amount, payment_method, status, version FROM payments"
+SQL_INSERT = (
+    "INSERT INTO payments (payment_id, amount, payment_method, status) VALUES (?, ?, ?, ?)"
+)
+SQL_UPDATE = """
+UPDATE payments
+SET amount = ?, payment_method = ?, status = ?, version = version + 1
+WHERE payment_id = ? AND version = ?
+"""
+
+T = TypeVar("T")
+
+
+class StaleWriteError(Exception):
+    """El pago cambió en la base desde que se leyó; la operación debe reintentarse."""
+
+
+_CONN: Optional[sqlite3.Connection] = None
+_LOCK = threading.RLock()
+# Copia en memoria de la tabla `payments`: se carga una vez y se actualiza en
+# cada escritura. Si otro escritor modifica `DB_PATH`, el control de `version`
+# lo detecta y la copia se recarga.
+_CACHE: Optional[Dict[str, PaymentDict]] = None
+# Ids de los pagos agrupados por (payment_method, status); se reconstruye junto
+# con `_CACHE` y se mantiene en cada escritura.
+_BY_MS: DefaultDict[Tuple[int, int], Set[str]] = defaultdict(set)
+_EMPTY: AbstractSet[str] = frozenset()
+# Indica si la transacción en curso ya tocó `_CACHE`; solo en ese caso hace
+# falta descartarlo ante un ROLLBACK.
+_CACHE_DIRTY = False
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    load_cache()
+    yield
+    await asyncio.to_thread(checkpoint_and_close)
+
 
 app = FastAPI(
     title="Payment Management API",
     description="API pública para gestionar el ciclo de vida de pagos online",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 
@@ -34,57 +155,268 @@ class Payment(BaseModel):
     status: str
 
 
+class PaymentIn(BaseModel):
+    payment_id: str
+    amount: float = Field(..., gt=0, description="Monto del pago")
+    payment_method: str = Field(..., description="Método de pago")
+
+    @field_validator("payment_method")
+    @classmethod
+    def normalize_method(cls, value: str) -> str:
+        normalized = value.lower()
+        if normalized not in SUPPORTED_PAYMENT_METHODS:
+            raise ValueError("Método de pago no soportado")
+        return normalized
+
+
 # --- Storage helpers -----------------------------------------------------
 
-def ensure_data_file() -> None:
-    if not DATA_PATH.exists():
-        DATA_PATH.write_text("{}", encoding="utf-8")
+def connect(path: Path) -> sqlite3.Connection:
+    # isolation_level=None: sqlite3 no abre transacciones implícitas; cada
+    # operación abre la suya con BEGIN IMMEDIATE en `transaction()`.
+    conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KIB}")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE_BYTES}")
+    conn.execute(f"PRAGMA wal_autocheckpoint={WAL_CHECKPOINT_PAGES}")
+    conn.execute(f"PRAGMA journal_size_limit={WAL_SIZE_LIMIT_BYTES}")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def get_connection() -> sqlite3.Connection:
+    global _CONN
+    with _LOCK:
+        if _CONN is None:
+            _CONN = connect(DB_PATH)
+        return _CONN
+
+
+def close_connection() -> None:
+    global _CONN
+    with _LOCK:
+        if _CONN is not None:
+            _CONN.close()
+            _CONN = None
+        invalidate_cache()
+
+
+def checkpoint_and_close() -> None:
+    # Con WAL + synchronous=NORMAL los COMMIT no hacen fsync: SQLite acumula las
+    # escrituras en el WAL y las baja al archivo principal en cada checkpoint.
+    # Al apagar se fuerza uno para no dejar trabajo pendiente en el WAL.
+    with _LOCK:
+        if _CONN is not None:
+            _CONN.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        close_connection()
+
+
+def import_legacy_data(conn: sqlite3.Connection) -> bool:
+    """Copia los pagos de `LEGACY_DATA_PATH` a una tabla `payments` vacía."""
+    if not LEGACY_DATA_PATH.exists():
+        return False
+    if conn.execute("SELECT 1 FROM payments LIMIT 1").fetchone() is not None:
+        return False
+    raw = LEGACY_DATA_PATH.read_text(encoding="utf-8").strip() or "{}"
+    rows = [
+        (
+            pid,
+            payment["amount"],
+            _METHOD_FROM_STR[payment["payment_method"].lower()],
+            Status[payment["status"]],
+        )
+        for pid, payment in json.loads(raw).items()
+    ]
+    conn.executemany(SQL_INSERT, rows)
+    return bool(rows)
+
+
+def load_cache() -> Dict[str, PaymentDict]:
+    global _CACHE, _CACHE_DIRTY
+    with _LOCK:
+        if _CACHE is None:
+            conn = get_connection()
+            if conn.in_transaction:
+                # La importación queda dentro de la transacción en curso: si
+                # se revierte, la copia en memoria también debe descartarse.
+                if import_legacy_data(conn):
+                    _CACHE_DIRTY = True
+            else:
+                with transaction():
+                    import_legacy_data(conn)
+            rows = conn.execute(SQL_SELECT_ALL).fetchall()
+            _CACHE = {row["payment_id"]: row_to_payment(row) for row in rows}
+            _BY_MS.clear()
+            for pid, payment in _CACHE.items():
+                _BY_MS[bucket_key(payment)].add(pid)
+        return _CACHE
+
+
+def invalidate_cache() -> None:
+    global _CACHE
+    with _LOCK:
+        _CACHE = None
+
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """Serializa un read-modify-write completo en un único BEGIN IMMEDIATE ... COMMIT."""
+    global _CACHE_DIRTY
+    with _LOCK:
+        conn = get_connection()
+        conn.execute("BEGIN IMMEDIATE")
+        _CACHE_DIRTY = False
+        try:
+            yield conn
+            # El COMMIT también puede fallar (BUSY, IOERR, FULL): en ese caso
+            # hay que deshacer y descartar lo que ya se copió a la caché.
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            if _CACHE_DIRTY:
+                invalidate_cache()
+            raise
+
+
+def bucket_key(payment: PaymentDict) -> Tuple[int, int]:
+    return payment["payment_method"], payment["status"]
+
+
+def payments_in(payment_method: PaymentMethod, status: Status) -> AbstractSet[str]:
+    return _BY_MS.get((payment_method, status), _EMPTY)
+
+
+def row_to_payment(row: sqlite3.Row) -> PaymentDict:
+    return {
+        "amount": row["amount"],
+        "payment_method": row["payment_method"],
+        "status": row["status"],
+        "version": row["version"],
+    }
+
+
+def get_payment(payment_id: str) -> Optional[PaymentDict]:
+    with _LOCK:
+        payment = load_cache().get(payment_id)
+    return payment.copy() if payment is not None else None
+
+
+def list_all_payments() -> Dict[str, PaymentDict]:
+    with _LOCK:
+        return dict(load_cache())
+
 
+def remember_payment(payment_id: str, payment: PaymentDict) -> None:
+    global _CACHE_DIRTY
+    cache = load_cache()
+    previous = cache.get(payment_id)
+    if previous is not None:
+        _BY_MS[bucket_key(previous)].discard(payment_id)
+    cache[payment_id] = payment.copy()
+    _BY_MS[bucket_key(payment)].add(payment_id)
+    _CACHE_DIRTY = True
 
-def load_all_payments() -> Dict[str, Dict]:
-    ensure_data_file()
-    with DATA_PATH.open("r", encoding="utf-8") as handler:
-        raw = handler.read().strip() or "{}"
-        return json.loads(raw)
 
+def integrity_error_to_http(exc: sqlite3.IntegrityError) -> HTTPException:
+    if exc.sqlite_errorname == "SQLITE_CONSTRAINT_PRIMARYKEY":
+        return HTTPException(status_code=409, detail="El pago ya existe")
+    if exc.sqlite_errorname == "SQLITE_CONSTRAINT_UNIQUE":
+        return HTTPException(
+            status_code=400,
+            detail="Ya existe un pago con tarjeta de crédito en estado REGISTRADO",
+        )
+    raise exc
+
+
+def insert_payments(payments: Dict[str, PaymentDict]) -> None:
+    with _LOCK:
+        try:
+            get_connection().executemany(
+                SQL_INSERT,
+                [
+                    (pid, payment["amount"], payment["payment_method"], payment["status"])
+                    for pid, payment in payments.items()
+                ],
+            )
+        except sqlite3.IntegrityError as exc:
+            raise integrity_error_to_http(exc) from exc
+        for pid, payment in payments.items():
+            remember_payment(pid, {**payment, "version": 0})
+
+
+def insert_payment(payment_id: str, payment: PaymentDict) -> None:
+    insert_payments({payment_id: payment})
+
+
+def update_payment_row(payment_id: str, payment: PaymentDict) -> None:
+    """Guarda `payment` solo si nadie lo modificó desde que se leyó su `version`."""
+    with _LOCK:
+        try:
+            cursor = get_connection().execute(
+                SQL_UPDATE,
+                (
+                    payment["amount"],
+                    payment["payment_method"],
+                    payment["status"],
+                    payment_id,
+                    payment["version"],
+                ),
+            )
+        except sqlite3.IntegrityError as exc:
+            raise integrity_error_to_http(exc) from exc
+        if cursor.rowcount == 0:
+            # Otro escritor tocó la base: toda la vista en memoria es sospechosa.
+            invalidate_cache()
+            raise StaleWriteError(payment_id)
+        remember_payment(payment_id, {**payment, "version": payment["version"] + 1})
+
+
+def retry_on_stale_write(operation: Callable[..., T]) -> Callable[..., T]:
+    @wraps(operation)
+    def wrapper(*args, **kwargs) -> T:
+        for _ in range(MAX_WRITE_ATTEMPTS):
+            try:
+                return operation(*args, **kwargs)
+            except StaleWriteError:
+                continue
+        raise HTTPException(
+            status_code=409, detail="El pago fue modificado por otra operación, reintentar"
+        )
 
-def save_all_payments(data: Dict[str, Dict]) -> None:
-    with DATA_PATH.open("w", encoding="utf-8") as handler:
-        json.dump(data, handler, indent=2)
+    return wrapper
 
 
 # --- Validation helpers --------------------------------------------------
 
-def normalize_payment_method(payment_method: str) -> str:
-    normalized = payment_method.lower()
-    if normalized not in SUPPORTED_PAYMENT_METHODS:
+def normalize_payment_method(payment_method: str) -> PaymentMethod:
+    method = _METHOD_FROM_STR.get(payment_method.lower())
+    if method is None:
         raise HTTPException(status_code=400, detail="Método de pago no soportado")
-    return normalized
+    return method
 
 
-def credit_card_pending_conflict(all_payments: Dict[str, Dict], current_id: str) -> bool:
-    return any(
-        payment["payment_method"] == PAYMENT_METHOD_CREDIT_CARD
-        and payment["status"] == STATUS_REGISTRADO
-        and pid != current_id
-        for pid, payment in all_payments.items()
-    )
+def credit_card_pending_conflict(current_id: str) -> bool:
+    with _LOCK:
+        load_cache()
+        pending = payments_in(PaymentMethod.CREDIT_CARD, Status.REGISTRADO)
+        return bool(pending) and not (len(pending) == 1 and current_id in pending)
 
 
-def ensure_credit_card_can_register(
-    *, payment_id: str, all_payments: Dict[str, Dict]
-) -> None:
-    if credit_card_pending_conflict(all_payments, payment_id):
+def ensure_credit_card_can_register(*, payment_id: str) -> None:
+    if credit_card_pending_conflict(payment_id):
         raise HTTPException(
             status_code=400,
             detail="Ya existe un pago con tarjeta de crédito en estado REGISTRADO",
         )
 
 
-def validate_credit_card(payment_id: str, amount: float, all_payments: Dict[str, Dict]) -> None:
+def validate_credit_card(payment_id: str, amount: float) -> None:
     if amount >= 10_000:
         raise HTTPException(status_code=400, detail="El monto supera el límite de $10.000")
-    ensure_credit_card_can_register(payment_id=payment_id, all_payments=all_payments)
+    ensure_credit_card_can_register(payment_id=payment_id)
 
 
 def validate_paypal(amount: float) -> None:
@@ -92,28 +424,173 @@ def validate_paypal(amount: float) -> None:
         raise HTTPException(status_code=400, detail="El monto supera el límite de $5.000 para PayPal")
 
 
-def validate_payment(payment_id: str, payment: Dict, all_payments: Dict[str, Dict]) -> None:
-    method = payment["payment_method"]
-    amount = payment["amount"]
-    if method == PAYMENT_METHOD_CREDIT_CARD:
-        validate_credit_card(payment_id, amount, all_payments)
-    elif method == PAYMENT_METHOD_PAYPAL:
-        validate_paypal(amount)
-    else:
+_METHOD_VALIDATORS: Dict[int, Callable[[str, float], None]] = {
+    PaymentMethod.CREDIT_CARD: validate_credit_card,
+    PaymentMethod.PAYPAL: lambda _payment_id, amount: validate_paypal(amount),
+}
+
+
+def validate_payment(payment_id: str, payment: PaymentDict) -> None:
+    validator = _METHOD_VALIDATORS.get(payment["payment_method"])
+    if validator is None:
         raise HTTPException(status_code=400, detail="Método de pago no soportado")
+    validator(payment_id, payment["amount"])
 
 
 # --- API helpers ---------------------------------------------------------
 
-def serialize_payments(payments: Iterable[tuple[str, Dict]]) -> List[Payment]:
-    return [Payment(payment_id=pid, **data) for pid, data in payments]
+def public_fields(payment: PaymentDict) -> Dict:
+    return {
+        "amount": payment["amount"],
+        "payment_method": _METHOD_TO_STR[payment["payment_method"]],
+        "status": _STATUS_TO_STR[payment["status"]],
+    }
 
 
-def get_payment_or_404(payment_id: str, data: Dict[str, Dict]) -> Dict:
-    try:
-        return data[payment_id]
-    except KeyError as exc:
-        raise HTTPException(status_code=404, detail="Pago no encontrado") from exc
+def _to_response(payment_id: str, payment: PaymentDict) -> Payment:
+    # Los datos internos ya se validaron al ingresar (query params o PaymentIn):
+    # no hace falta que pydantic los revalide al armar la respuesta.
+    return Payment.model_construct(payment_id=payment_id, **public_fields(payment))
+
+
+def serialize_payments(payments: Iterable[tuple[str, PaymentDict]]) -> List[Payment]:
+    return [_to_response(pid, payment) for pid, payment in payments]
+
+
+def payments_to_json(payments: Iterable[tuple[str, PaymentDict]]) -> List[Dict]:
+    return [{"payment_id": pid, **public_fields(payment)} for pid, payment in payments]
+
+
+def get_payment_or_404(payment_id: str) -> PaymentDict:
+    payment = get_payment(payment_id)
+    if payment is None:
+        raise HTTPException(status_code=404, detail="Pago no encontrado")
+    return payment
+
+
+# --- Operations ----------------------------------------------------------
+# Cada operación corre completa (validación + escritura) dentro de una
+# transacción y es bloqueante: los endpoints la ejecutan con `asyncio.to_thread`.
+
+
+def register_payments_batch_tx(items: List[PaymentIn]) -> List[Payment]:
+    with transaction():
+        data = load_cache()
+        batch: Dict[str, PaymentDict] = {}
+        credit_card_pending = bool(payments_in(PaymentMethod.CREDIT_CARD, Status.REGISTRADO))
+        for index, item in enumerate(items):
+            try:
+                if item.payment_id in data or item.payment_id in batch:
+                    raise HTTPException(status_code=409, detail="El pago ya existe")
+
+                method = _METHOD_FROM_STR[item.payment_method]
+                if method == PaymentMethod.CREDIT_CARD:
+                    if credit_card_pending:
+                        raise HTTPException(
+                            status_code=400,
+                            detail="Ya existe un pago con tarjeta de crédito en estado REGISTRADO",
+                        )
+                    credit_card_pending = True
+            except HTTPException as exc:
+                raise HTTPException(
+                    status_code=exc.status_code,
+                    detail={"index": index, "detail": exc.detail},
+                ) from None
+
+            batch[item.payment_id] = {
+                "amount": item.amount,
+                "payment_method": method,
+                "status": Status.REGISTRADO,
+            }
+
+        insert_payments(batch)
+    return serialize_payments(batch.items())
+
+
+def register_payment_tx(payment_id: str, amount: float, payment_method: str) -> Payment:
+    with transaction():
+        # Mismo orden de errores que siempre: id repetido (409), método no
+        # soportado y recién después la regla de tarjeta. Sin este chequeo el
+        # índice cc_one_pending le ganaría a la PRIMARY KEY y daría 400.
+        if payment_id in load_cache():
+            raise HTTPException(status_code=409, detail="El pago ya existe")
+
+        normalized_method = normalize_payment_method(payment_method)
+        payment: PaymentDict = {
+            "amount": amount,
+            "payment_method": normalized_method,
+            "status": Status.REGISTRADO,
+        }
+        if normalized_method == PaymentMethod.CREDIT_CARD:
+            ensure_credit_card_can_register(payment_id=payment_id)
+        insert_payment(payment_id, payment)
+    return _to_response(payment_id, payment)
+
+
+@retry_on_stale_write
+def update_payment_tx(payment_id: str, amount: float, payment_method: str) -> Payment:
+    with transaction():
+        payment = get_payment_or_404(payment_id)
+        if payment["status"] != Status.REGISTRADO:
+            raise HTTPException(status_code=400, detail="Solo se pueden actualizar pagos en estado REGISTRADO")
+
+        normalized_method = normalize_payment_method(payment_method)
+        payment.update({
+            "amount": amount,
+            "payment_method": normalized_method,
+        })
+
+        if normalized_method == PaymentMethod.CREDIT_CARD:
+            ensure_credit_card_can_register(payment_id=payment_id)
+
+        update_payment_row(payment_id, payment)
+    return _to_response(payment_id, payment)
+
+
+@retry_on_stale_write
+def pay_payment_tx(payment_id: str) -> Payment:
+    failure: Optional[HTTPException] = None
+    with transaction():
+        payment = get_payment_or_404(payment_id)
+        if payment["status"] != Status.REGISTRADO:
+            raise HTTPException(status_code=400, detail="Solo se pueden pagar pagos en estado REGISTRADO")
+
+        # Se decide el estado final antes de escribir: una sola escritura por
+        # llamada, y el error de un pago FALLIDO se propaga después del COMMIT.
+        try:
+            validate_payment(payment_id, payment)
+        except HTTPException as exc:
+            failure = exc
+        payment["status"] = Status.PAGADO if failure is None else Status.FALLIDO
+        update_payment_row(payment_id, payment)
+
+    if failure is not None:
+        raise failure
+    return _to_response(payment_id, payment)
+
+
+@retry_on_stale_write
+def revert_payment_tx(payment_id: str) -> Payment:
+    with transaction():
+        payment = get_payment_or_404(payment_id)
+        if payment["status"] != Status.FALLIDO:
+            raise HTTPException(status_code=400, detail="Solo se pueden revertir pagos FALLIDOS")
+
+        payment["status"] = Status.REGISTRADO
+        update_payment_row(payment_id, payment)
+    return _to_response(payment_id, payment)
+
+
+@retry_on_stale_write
+def cancel_payment_tx(payment_id: str) -> Payment:
+    with transaction():
+        payment = get_payment_or_404(payment_id)
+        if payment["status"] != Status.REGISTRADO:
+            raise HTTPException(status_code=400, detail="Solo se pueden cancelar pagos REGISTRADOS")
+
+        payment["status"] = Status.CANCELADO
+        update_payment_row(payment_id, payment)
+    return _to_response(payment_id, payment)
 
 
 # --- Endpoints -----------------------------------------------------------
@@ -124,103 +601,47 @@ def root() -> RedirectResponse:
     return RedirectResponse(url="/docs")
 
 
-@app.get("/payments", response_model=List[Payment])
-def list_payments() -> List[Payment]:
-    data = load_all_payments()
-    return serialize_payments(data.items())
+@app.get("/payments", response_model=List[Payment], response_class=ORJSONResponse)
+async def list_payments() -> ORJSONResponse:
+    # Se devuelve la respuesta ya serializada: FastAPI no arma modelos ni pasa
+    # por jsonable_encoder; `response_model` queda solo para la documentación.
+    data = await asyncio.to_thread(list_all_payments)
+    return ORJSONResponse(payments_to_json(data.items()))
+
+
+@app.post("/payments/batch", response_model=List[Payment], status_code=201)
+async def register_payments_batch(items: List[PaymentIn]) -> List[Payment]:
+    return await asyncio.to_thread(register_payments_batch_tx, items)
 
 
 @app.post("/payments/{payment_id}", response_model=Payment, status_code=201)
-def register_payment(
+async def register_payment(
     payment_id: str,
     amount: float = Query(..., gt=0, description="Monto del pago"),
     payment_method: str = Query(..., description="Método de pago"),
 ) -> Payment:
-    data = load_all_payments()
-    if payment_id in data:
-        raise HTTPException(status_code=409, detail="El pago ya existe")
-
-    normalized_method = normalize_payment_method(payment_method)
-    if normalized_method == PAYMENT_METHOD_CREDIT_CARD:
-        ensure_credit_card_can_register(payment_id=payment_id, all_payments=data)
-
-    payment = {
-        "amount": amount,
-        "payment_method": normalized_method,
-        "status": STATUS_REGISTRADO,
-    }
-    data[payment_id] = payment
-    save_all_payments(data)
-    return Payment(payment_id=payment_id, **payment)
+    return await asyncio.to_thread(register_payment_tx, payment_id, amount, payment_method)
 
 
 @app.post("/payments/{payment_id}/update", response_model=Payment)
-def update_payment(
+async def update_payment(
     payment_id: str,
     amount: float = Query(..., gt=0, description="Nuevo monto del pago"),
     payment_method: str = Query(..., description="Nuevo método de pago"),
 ) -> Payment:
-    data = load_all_payments()
-    payment = get_payment_or_404(payment_id, data)
-    if payment["status"] != STATUS_REGISTRADO:
-        raise HTTPException(status_code=400, detail="Solo se pueden actualizar pagos en estado REGISTRADO")
-
-    normalized_method = normalize_payment_method(payment_method)
-    payment.update({
-        "amount": amount,
-        "payment_method": normalized_method,
-    })
-
-    if normalized_method == PAYMENT_METHOD_CREDIT_CARD:
-        ensure_credit_card_can_register(payment_id=payment_id, all_payments=data)
-
-    data[payment_id] = payment
-    save_all_payments(data)
-    return Payment(payment_id=payment_id, **payment)
+    return await asyncio.to_thread(update_payment_tx, payment_id, amount, payment_method)
 
 
 @app.post("/payments/{payment_id}/pay", response_model=Payment)
-def pay_payment(payment_id: str) -> Payment:
-    data = load_all_payments()
-    payment = get_payment_or_404(payment_id, data)
-    if payment["status"] != STATUS_REGISTRADO:
-        raise HTTPException(status_code=400, detail="Solo se pueden pagar pagos en estado REGISTRADO")
-
-    try:
-        validate_payment(payment_id, payment, data)
-    except HTTPException:
-        payment["status"] = STATUS_FALLIDO
-        data[payment_id] = payment
-        save_all_payments(data)
-        raise
-
-    payment["status"] = STATUS_PAGADO
-    data[payment_id] = payment
-    save_all_payments(data)
-    return Payment(payment_id=payment_id, **payment)
+async def pay_payment(payment_id: str) -> Payment:
+    return await asyncio.to_thread(pay_payment_tx, payment_id)
 
 
 @app.post("/payments/{payment_id}/revert", response_model=Payment)
-def revert_payment(payment_id: str) -> Payment:
-    data = load_all_payments()
-    payment = get_payment_or_404(payment_id, data)
-    if payment["status"] != STATUS_FALLIDO:
-        raise HTTPException(status_code=400, detail="Solo se pueden revertir pagos FALLIDOS")
-
-    payment["status"] = STATUS_REGISTRADO
-    data[payment_id] = payment
-    save_all_payments(data)
-    return Payment(payment_id=payment_id, **payment)
+async def revert_payment(payment_id: str) -> Payment:
+    return await asyncio.to_thread(revert_payment_tx, payment_id)
 
 
 @app.post("/payments/{payment_id}/cancel", response_model=Payment)
-def cancel_payment(payment_id: str) -> Payment:
-    data = load_all_payments()
-    payment = get_payment_or_404(payment_id, data)
-    if payment["status"] != STATUS_REGISTRADO:
-        raise HTTPException(status_code=400, detail="Solo se pueden cancelar pagos REGISTRADOS")
-
-    payment["status"] = STATUS_CANCELADO
-    data[payment_id] = payment
-    save_all_payments(data)
-    return Payment(payment_id=payment_id, **payment)
+async def cancel_payment(payment_id: str) -> Payment:
+    return await asyncio.to_thread(cancel_payment_tx, payment_id)
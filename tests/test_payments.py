@@ -1,9 +1,14 @@
+import asyncio
 import json
+import sqlite3
 import sys
+from contextlib import closing
 from importlib import import_module
 from pathlib import Path
 
 import pytest
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
 
 ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
@@ -13,76 +18,98 @@ main = import_module("main")
 
 
 def setup_temp_store(tmp_path, monkeypatch):
-    tmp_file = tmp_path / "data.json"
-    tmp_file.write_text("{}", encoding="utf-8")
-    monkeypatch.setattr(main, "DATA_PATH", tmp_file)
+    tmp_file = tmp_path / "data.db"
+    main.close_connection()
+    monkeypatch.setattr(main, "DB_PATH", tmp_file)
+    monkeypatch.setattr(main, "LEGACY_DATA_PATH", tmp_path / "data.json")
     return tmp_file
 
 
+def call(endpoint, **kwargs):
+    return asyncio.run(endpoint(**kwargs))
+
+
+def list_stored_payments():
+    return json.loads(call(main.list_payments).body)
+
+
 def read_raw_data(path):
-    return json.loads(path.read_text(encoding="utf-8"))
+    with closing(sqlite3.connect(path)) as conn:
+        rows = conn.execute(
+            "SELECT payment_id, amount, payment_method, status FROM payments"
+        ).fetchall()
+    return {
+        pid: {"amount": amount, "payment_method": method, "status": status}
+        for pid, amount, method, status in rows
+    }
 
 
 def test_credit_card_flow(tmp_path, monkeypatch):
     data_file = setup_temp_store(tmp_path, monkeypatch)
 
-    payment = main.register_payment(
+    payment = call(
+        main.register_payment,
         payment_id="pay-1", amount=100.5, payment_method="credit_card"
     )
     assert payment.status == main.STATUS_REGISTRADO
 
-    paid = main.pay_payment(payment_id="pay-1")
+    paid = call(main.pay_payment, payment_id="pay-1")
     assert paid.status == main.STATUS_PAGADO
 
-    listed = main.list_payments()
+    listed = list_stored_payments()
     assert len(listed) == 1
-    assert listed[0].status == main.STATUS_PAGADO
+    assert listed[0]["status"] == main.STATUS_PAGADO
 
     payload = read_raw_data(data_file)
-    assert payload["pay-1"]["status"] == main.STATUS_PAGADO
+    assert payload["pay-1"]["status"] == main.Status.PAGADO
 
 
 def test_paypal_validation_and_revert(tmp_path, monkeypatch):
     data_file = setup_temp_store(tmp_path, monkeypatch)
 
-    payment = main.register_payment(
+    payment = call(
+        main.register_payment,
         payment_id="pay-2", amount=6000, payment_method="paypal"
     )
     assert payment.status == main.STATUS_REGISTRADO
 
     with pytest.raises(main.HTTPException):
-        main.pay_payment(payment_id="pay-2")
+        call(main.pay_payment, payment_id="pay-2")
 
     stored = read_raw_data(data_file)
-    assert stored["pay-2"]["status"] == main.STATUS_FALLIDO
+    assert stored["pay-2"]["status"] == main.Status.FALLIDO
 
-    reverted = main.revert_payment(payment_id="pay-2")
+    reverted = call(main.revert_payment, payment_id="pay-2")
     assert reverted.status == main.STATUS_REGISTRADO
 
-    updated = main.update_payment(
+    updated = call(
+        main.update_payment,
         payment_id="pay-2", amount=2000, payment_method="paypal"
     )
     assert updated.amount == 2000
 
-    paid = main.pay_payment(payment_id="pay-2")
+    paid = call(main.pay_payment, payment_id="pay-2")
     assert paid.status == main.STATUS_PAGADO
 
 
 def test_credit_card_pending_constraint(tmp_path, monkeypatch):
     setup_temp_store(tmp_path, monkeypatch)
 
-    main.register_payment(
+    call(
+        main.register_payment,
         payment_id="pay-cc-1", amount=100, payment_method="credit_card"
     )
 
     with pytest.raises(main.HTTPException):
-        main.register_payment(
+        call(
+            main.register_payment,
             payment_id="pay-cc-2", amount=50, payment_method="credit_card"
         )
 
-    main.pay_payment(payment_id="pay-cc-1")
+    call(main.pay_payment, payment_id="pay-cc-1")
 
-    second = main.register_payment(
+    second = call(
+        main.register_payment,
         payment_id="pay-cc-2", amount=50, payment_method="credit_card"
     )
     assert second.status == main.STATUS_REGISTRADO
@@ -91,18 +118,239 @@ def test_credit_card_pending_constraint(tmp_path, monkeypatch):
 def test_cancel_payment_flow(tmp_path, monkeypatch):
     setup_temp_store(tmp_path, monkeypatch)
 
-    payment = main.register_payment(
+    payment = call(
+        main.register_payment,
         payment_id="cancel-1", amount=300, payment_method="paypal"
     )
     assert payment.status == main.STATUS_REGISTRADO
 
-    canceled = main.cancel_payment(payment_id="cancel-1")
+    canceled = call(main.cancel_payment, payment_id="cancel-1")
     assert canceled.status == main.STATUS_CANCELADO
 
     with pytest.raises(main.HTTPException):
-        main.update_payment(
+        call(
+            main.update_payment,
             payment_id="cancel-1", amount=200, payment_method="paypal"
         )
 
     with pytest.raises(main.HTTPException):
-        main.pay_payment(payment_id="cancel-1")
+        call(main.pay_payment, payment_id="cancel-1")
+
+
+def test_rejected_update_does_not_leak_into_cache(tmp_path, monkeypatch):
+    data_file = setup_temp_store(tmp_path, monkeypatch)
+
+    call(
+        main.register_payment,
+        payment_id="cache-cc", amount=100, payment_method="credit_card"
+    )
+    call(
+        main.register_payment,
+        payment_id="cache-pp", amount=200, payment_method="paypal"
+    )
+
+    with pytest.raises(main.HTTPException):
+        call(
+            main.update_payment,
+            payment_id="cache-pp", amount=300, payment_method="credit_card"
+        )
+
+    listed = {payment["payment_id"]: payment for payment in list_stored_payments()}
+    assert listed["cache-pp"]["amount"] == 200
+    assert listed["cache-pp"]["payment_method"] == main.PAYMENT_METHOD_PAYPAL
+    assert read_raw_data(data_file)["cache-pp"]["amount"] == 200
+
+
+def test_register_payments_batch(tmp_path, monkeypatch):
+    data_file = setup_temp_store(tmp_path, monkeypatch)
+
+    created = call(
+        main.register_payments_batch,
+        items=[
+            main.PaymentIn(payment_id="batch-1", amount=100, payment_method="CREDIT_CARD"),
+            main.PaymentIn(payment_id="batch-2", amount=200, payment_method="paypal"),
+        ]
+    )
+    assert [payment.payment_id for payment in created] == ["batch-1", "batch-2"]
+    assert created[0].payment_method == main.PAYMENT_METHOD_CREDIT_CARD
+
+    with pytest.raises(main.HTTPException) as excinfo:
+        call(
+            main.register_payments_batch,
+            items=[
+                main.PaymentIn(payment_id="batch-3", amount=50, payment_method="paypal"),
+                main.PaymentIn(payment_id="batch-4", amount=50, payment_method="credit_card"),
+            ]
+        )
+    assert excinfo.value.status_code == 400
+    assert excinfo.value.detail["index"] == 1
+
+    stored = read_raw_data(data_file)
+    assert sorted(stored) == ["batch-1", "batch-2"]
+
+
+def test_register_duplicate_payment_conflict(tmp_path, monkeypatch):
+    setup_temp_store(tmp_path, monkeypatch)
+
+    call(main.register_payment, payment_id="dup-1", amount=100, payment_method="paypal")
+
+    with pytest.raises(main.HTTPException) as excinfo:
+        call(main.register_payment, payment_id="dup-1", amount=200, payment_method="paypal")
+    assert excinfo.value.status_code == 409
+
+    listed = list_stored_payments()
+    assert len(listed) == 1
+    assert listed[0]["amount"] == 100
+
+
+def test_errors_through_asgi_stack(tmp_path, monkeypatch):
+    setup_temp_store(tmp_path, monkeypatch)
+
+    with TestClient(main.app) as client:
+        params = {"amount": 6000, "payment_method": "paypal"}
+        assert client.post("/payments/http-1", params=params).status_code == 201
+
+        duplicate = client.post("/payments/http-1", params=params)
+        assert duplicate.status_code == 409
+        assert duplicate.json() == {"detail": "El pago ya existe"}
+
+        for _ in range(2):
+            failed = client.post("/payments/http-1/pay")
+            assert failed.status_code == 400
+            client.post("/payments/http-1/revert")
+        assert failed.json() == {"detail": "El monto supera el límite de $5.000 para PayPal"}
+
+
+def test_register_duplicate_credit_card_payment_conflict(tmp_path, monkeypatch):
+    setup_temp_store(tmp_path, monkeypatch)
+
+    call(main.register_payment, payment_id="dup-cc", amount=100, payment_method="credit_card")
+
+    with pytest.raises(main.HTTPException) as excinfo:
+        call(main.register_payment, payment_id="dup-cc", amount=200, payment_method="credit_card")
+    assert excinfo.value.status_code == 409
+
+    listed = list_stored_payments()
+    assert len(listed) == 1
+    assert listed[0]["amount"] == 100
+
+
+def test_register_duplicate_id_conflict_wins_over_other_errors(tmp_path, monkeypatch):
+    setup_temp_store(tmp_path, monkeypatch)
+
+    call(main.register_payment, payment_id="y", amount=100, payment_method="paypal")
+    call(main.register_payment, payment_id="cc-1", amount=100, payment_method="credit_card")
+
+    with pytest.raises(main.HTTPException) as excinfo:
+        call(main.register_payment, payment_id="y", amount=100, payment_method="credit_card")
+    assert excinfo.value.status_code == 409
+
+    with pytest.raises(main.HTTPException) as excinfo:
+        call(main.register_payment, payment_id="y", amount=100, payment_method="bitcoin")
+    assert excinfo.value.status_code == 409
+
+    stored = {payment["payment_id"]: payment for payment in list_stored_payments()}
+    assert stored["y"]["payment_method"] == main.PAYMENT_METHOD_PAYPAL
+
+
+def test_legacy_json_is_imported_once(tmp_path, monkeypatch):
+    db_path = setup_temp_store(tmp_path, monkeypatch)
+    legacy = {
+        "old-cc": {"amount": 200, "payment_method": "credit_card", "status": "REGISTRADO"},
+        "old-pp": {"amount": 50, "payment_method": "paypal", "status": "FALLIDO"},
+    }
+    (tmp_path / "data.json").write_text(json.dumps(legacy), encoding="utf-8")
+
+    assert {p["payment_id"]: p["status"] for p in list_stored_payments()} == {
+        "old-cc": main.STATUS_REGISTRADO,
+        "old-pp": main.STATUS_FALLIDO,
+    }
+    assert read_raw_data(db_path)["old-cc"] == {
+        "amount": 200,
+        "payment_method": main.PaymentMethod.CREDIT_CARD,
+        "status": main.Status.REGISTRADO,
+    }
+
+    with pytest.raises(main.HTTPException) as excinfo:
+        call(main.register_payment, payment_id="new-cc", amount=10, payment_method="credit_card")
+    assert excinfo.value.status_code == 400
+
+    call(main.pay_payment, payment_id="old-cc")
+    main.close_connection()
+    assert len(list_stored_payments()) == 2
+    assert read_raw_data(db_path)["old-cc"]["status"] == main.Status.PAGADO
+
+
+def test_stale_cache_is_reloaded_on_version_conflict(tmp_path, monkeypatch):
+    data_file = setup_temp_store(tmp_path, monkeypatch)
+
+    call(main.register_payment, payment_id="occ-1", amount=100, payment_method="paypal")
+
+    with closing(sqlite3.connect(data_file)) as conn:
+        conn.execute(
+            "UPDATE payments SET status = ?, version = version + 1 WHERE payment_id = ?",
+            (main.Status.CANCELADO, "occ-1"),
+        )
+        conn.commit()
+
+    with pytest.raises(main.HTTPException) as excinfo:
+        call(main.update_payment, payment_id="occ-1", amount=200, payment_method="paypal")
+    assert excinfo.value.status_code == 400
+
+    listed = list_stored_payments()
+    assert listed[0]["status"] == main.STATUS_CANCELADO
+    assert listed[0]["amount"] == 100
+
+
+def test_payment_in_normalizes_method():
+    assert main.PaymentIn(payment_id="x", amount=1, payment_method="PayPal").payment_method == "paypal"
+
+    with pytest.raises(ValidationError):
+        main.PaymentIn(payment_id="x", amount=1, payment_method="bitcoin")
+
+
+class FailingCommitConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def commit(self):
+        raise sqlite3.OperationalError("disk I/O error")
+
+
+def test_failed_commit_rolls_back_and_drops_cache(tmp_path, monkeypatch):
+    data_file = setup_temp_store(tmp_path, monkeypatch)
+
+    call(main.register_payment, payment_id="commit-1", amount=100, payment_method="paypal")
+
+    real_conn = main.get_connection()
+    monkeypatch.setattr(main, "_CONN", FailingCommitConnection(real_conn))
+    with pytest.raises(sqlite3.OperationalError):
+        call(main.register_payment, payment_id="commit-2", amount=200, payment_method="paypal")
+    monkeypatch.setattr(main, "_CONN", real_conn)
+
+    assert [payment["payment_id"] for payment in list_stored_payments()] == ["commit-1"]
+
+    call(main.register_payment, payment_id="commit-3", amount=300, payment_method="paypal")
+    assert sorted(read_raw_data(data_file)) == ["commit-1", "commit-3"]
+
+
+def test_revert_credit_card_blocked_by_pending_credit_card(tmp_path, monkeypatch):
+    data_file = setup_temp_store(tmp_path, monkeypatch)
+
+    call(main.register_payment, payment_id="rev-cc-1", amount=12_000, payment_method="credit_card")
+    with pytest.raises(main.HTTPException):
+        call(main.pay_payment, payment_id="rev-cc-1")
+
+    call(main.register_payment, payment_id="rev-cc-2", amount=100, payment_method="credit_card")
+
+    with pytest.raises(main.HTTPException) as excinfo:
+        call(main.revert_payment, payment_id="rev-cc-1")
+    assert excinfo.value.status_code == 400
+    assert excinfo.value.detail == "Ya existe un pago con tarjeta de crédito en estado REGISTRADO"
+
+    assert read_raw_data(data_file)["rev-cc-1"]["status"] == main.Status.FALLIDO
+    listed = {payment["payment_id"]: payment for payment in list_stored_payments()}
+    assert listed["rev-cc-1"]["status"] == main.STATUS_FALLIDO
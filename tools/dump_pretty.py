@@ -0,0 +1,45 @@
+"""Vuelca el contenido de `data.db` como JSON indentado, para inspección manual.
+
+La base guarda estados y métodos como enteros; acá se traducen a los mismos
+strings que expone la API, con el formato del antiguo `data.json`.
+
+Uso:
+    python tools/dump_pretty.py [ruta/a/data.db]
+"""
+
+import argparse
+import json
+import sqlite3
+import sys
+from contextlib import closing
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from main import DB_PATH, SQL_SELECT_ALL, public_fields  # noqa: E402
+
+
+def dump(path: Path) -> dict:
+    # Solo lectura: no se crean el archivo ni el esquema si no existen.
+    with closing(sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True)) as conn:
+        conn.row_factory = sqlite3.Row
+        return {
+            row["payment_id"]: public_fields(row)
+            for row in conn.execute(SQL_SELECT_ALL)
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", nargs="?", type=Path, default=DB_PATH)
+    args = parser.parse_args()
+    if not args.path.exists():
+        parser.error(f"no existe {args.path}")
+    json.dump(dump(args.path), sys.stdout, indent=2, ensure_ascii=False)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()